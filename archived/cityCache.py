@@ -0,0 +1,130 @@
+import collections
+import os
+import threading
+
+import numpy as np
+
+CACHE_DIR = "data/ArrowFiles"
+MAX_CACHED_CITIES = 4
+COLUMNS = ["longitude", "latitude", "population"]
+
+
+
+class CityDataset:
+    """
+    The longitude, latitude and population columns of a city, as numpy views over a memory-mapped Arrow IPC file.
+    Points are sorted by longitude so the bounding box of a polygon can be found with a binary search.
+
+    """
+    def __init__(self, arrow_path):
+        import pyarrow as pa
+
+        self.arrow_path = arrow_path
+        self.table = pa.ipc.open_file(pa.memory_map(arrow_path, "r")).read_all()
+
+        #Zero-copy views, the data stays in the page cache and is shared between every session and process
+        self.longitude = self.table.column("longitude").chunk(0).to_numpy(zero_copy_only=True)
+        self.latitude = self.table.column("latitude").chunk(0).to_numpy(zero_copy_only=True)
+        self.population = self.table.column("population").chunk(0).to_numpy(zero_copy_only=True)
+
+    def __len__(self):
+        return len(self.longitude)
+
+    def calculate_population(self, polygon):
+        """
+        Calculate the population of the inside of a given polygon
+        """
+        import shapely
+
+        minx, miny, maxx, maxy = polygon.bounds
+
+        start = np.searchsorted(self.longitude, minx, side="left") #Only check values within the rectangular bounds of the polygon
+        end = np.searchsorted(self.longitude, maxx, side="right")
+        lon, lat, pop = self.longitude[start:end], self.latitude[start:end], self.population[start:end]
+
+        in_bbox = (lat >= miny) & (lat <= maxy)
+        lon, lat, pop = lon[in_bbox], lat[in_bbox], pop[in_bbox]
+
+        inside = shapely.contains_xy(polygon, lon, lat) #Determine points inside the polygon
+        return pop[inside].sum()
+
+
+class CityCache:
+    """
+    Process-wide LRU cache of CityDatasets. Parquet files are converted once into uncompressed Arrow IPC files
+    in cache_dir, which are then memory-mapped, so loading or switching to a converted city takes milliseconds.
+
+    """
+    def __init__(self, max_cities = MAX_CACHED_CITIES, cache_dir = CACHE_DIR):
+        self.max_cities = max_cities
+        self.cache_dir = cache_dir
+        self.datasets = collections.OrderedDict()  # {input_file: CityDataset}, least recently used first
+        self.lock = threading.Lock()
+        self.file_locks = collections.defaultdict(threading.Lock)
+        self.prewarm_thread = None
+
+    def arrow_path(self, input_file):
+        name = os.path.splitext(os.path.basename(input_file))[0]
+        return os.path.join(self.cache_dir, f"{name}.arrow")
+
+    def convert(self, input_file):
+        """
+        Write the Arrow IPC copy of a parquet file if it is missing or older than the parquet file, and return its path
+        """
+        arrow_path = self.arrow_path(input_file)
+
+        with self.file_locks[input_file]:
+            if os.path.exists(arrow_path) and os.path.getmtime(arrow_path) >= os.path.getmtime(input_file):
+                return arrow_path
+
+            import pyarrow.feather as feather
+            import pyarrow.parquet as pq
+
+            print(f"Converting {input_file} to {arrow_path}...")
+            table = pq.read_table(input_file, columns=COLUMNS) #Skips decoding the geometry column entirely
+            table = table.sort_by("longitude").combine_chunks()
+
+            os.makedirs(self.cache_dir, exist_ok=True)
+            temp_path = f"{arrow_path}.{os.getpid()}.tmp"
+            feather.write_feather(table, temp_path, compression="uncompressed", chunksize=max(1, table.num_rows)) #One uncompressed batch, so columns map to single zero-copy arrays
+            os.replace(temp_path, arrow_path) #Atomic, so other processes never see a half written file
+
+        return arrow_path
+
+    def get(self, input_file):
+        """
+        Return the CityDataset for a parquet file, loading it and evicting the least recently used city if needed
+        """
+        with self.lock:
+            if input_file in self.datasets:
+                self.datasets.move_to_end(input_file)
+                return self.datasets[input_file]
+
+        dataset = CityDataset(self.convert(input_file))
+
+        with self.lock:
+            dataset = self.datasets.setdefault(input_file, dataset)
+            self.datasets.move_to_end(input_file)
+            while len(self.datasets) > self.max_cities:
+                self.datasets.popitem(last=False)
+        return dataset
+
+    def prewarm(self, input_files):
+        """
+        Convert every city in the background, and load as many as fit in the cache without evicting anything. Only runs once.
+        """
+        if self.prewarm_thread is not None:
+            return
+
+        def run():
+            for input_file in input_files:
+                if not os.path.exists(input_file):
+                    continue
+                self.convert(input_file)
+                with self.lock:
+                    has_room = len(self.datasets) < self.max_cities
+                if has_room:
+                    self.get(input_file)
+
+        self.prewarm_thread = threading.Thread(target=run, name="city-prewarm", daemon=True)
+        self.prewarm_thread.start()
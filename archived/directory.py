@@ -1,5 +1,5 @@
 import streamlit as st
-from generateMap import PopulationMapApp
+from generateMap import PopulationMapApp, get_city_cache
 
 st.set_page_config(layout="wide")
 
@@ -69,6 +69,9 @@ MAPS = {
         "lon_middle": 136.9066,
     }
 }
+# Convert and load the cities in the background, so switching city doesn't wait on disk
+get_city_cache().prewarm([city["input_file"] for city in MAPS.values()])
+
 st.sidebar.header("Select a City:")
 
 selected_city = st.sidebar.radio(label="Select a City:", options=list(MAPS.keys()))
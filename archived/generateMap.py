@@ -1,14 +1,18 @@
 import streamlit as st
-import numpy as np
-import folium
-import geopandas as gpd
 import itertools
 import json
 
-from folium.plugins import Draw
-from streamlit_folium import st_folium
-from shapely.geometry import Point, Polygon
-from folium.plugins import HeatMap
+from cityCache import CityCache
+
+#folium, streamlit_folium and shapely are imported where they are used, so the app starts without them loaded
+
+
+@st.cache_resource
+def get_city_cache():
+    """
+    One CityCache for the whole server process, shared by every session
+    """
+    return CityCache()
 
 
 
@@ -32,7 +36,9 @@ class PopulationMapApp:
         self.width_px = width_px
         self.height_px = height_px
 
-        if "gdf" not in st.session_state or st.session_state.current_file != self.input_file:
+        self.city = get_city_cache().get(self.input_file)
+
+        if "current_file" not in st.session_state or st.session_state.current_file != self.input_file:
             self.init_session_states()
 
         self.col1, self.col2 = st.columns([0.75, 0.25])
@@ -41,6 +47,7 @@ class PopulationMapApp:
         with self.col1:
             st.write("Draw a Shape on the Map")
             self.init_map()
+            from streamlit_folium import st_folium
             self.draw_data = st_folium(self.m, width=self.width_px, height=self.height_px)
             #st.write(f"Map Dimensions = {self.width_px} x {self.height_px}, Zoom Level = {self.zoom_level}")
 
@@ -52,8 +59,7 @@ class PopulationMapApp:
         """
         Initialise all the variables that will be kept throughout the session. This is only done once at the start and when a new map is chosen.
         """
-        st.session_state.current_file = self.input_file
-        st.session_state.gdf = gpd.read_parquet(self.input_file)
+        st.session_state.current_file = self.input_file #The dataset itself lives in the shared city cache
 
         st.session_state.shape_counter = itertools.count(1)  # Persistent unique shape IDs
         st.session_state.polygon_populations = {}  # {shape_id: population}
@@ -63,6 +69,8 @@ class PopulationMapApp:
         """
         Initialize the Folium map with draw, edit, and deletion toolls
         """
+        import folium
+        from folium.plugins import Draw
 
         self.m = folium.Map(
             location=[self.lat_middle, self.lon_middle],
@@ -90,16 +98,7 @@ class PopulationMapApp:
         """
         Calculate the population of the inside of a given polygon
         """
-        minx, miny, maxx, maxy = polygon.bounds #Only check values within the rectangular bounds of the polygon
-
-        bbox_filtered = st.session_state.gdf[ #Make the data rectangle smaller based on the bounds
-            (st.session_state.gdf["longitude"] >= minx) &
-            (st.session_state.gdf["longitude"] <= maxx) &
-            (st.session_state.gdf["latitude"] >= miny) &
-            (st.session_state.gdf["latitude"] <= maxy)]
-        
-        inside_points = bbox_filtered[bbox_filtered.within(polygon)] #Determine points inside the polygon
-        return inside_points["population"].sum()
+        return self.city.calculate_population(polygon)
     
     def printAllShapes(self):
         """
@@ -142,6 +141,8 @@ class PopulationMapApp:
         if not self.draw_data or self.draw_data["all_drawings"] is None:
             return
 
+        from shapely.geometry import Polygon
+
         shape_map_str = {json.dumps(k): v for k, v in st.session_state.shape_map.items()}
         self.valid_shape_indices = []
         for shape_info in self.draw_data["all_drawings"]:
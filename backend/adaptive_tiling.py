@@ -0,0 +1,106 @@
+"""
+Adaptive tile planning: split dense or clustered regions into finer tiles kept near native 3 arcsecond resolution,
+and store sparse or empty regions as coarse tiles.
+
+Each region is summarised as a grid of population sums, then split as a quadtree. Leaves are named by their quadrant
+path from the region ("" is the whole region, digits as in tile_catalog.quadkey: 0 SW, 1 SE, 2 NW, 3 NE).
+
+    grid = summarise(temp_raw)
+    for leaf in plan_tiles(grid, (minX, minY, maxX, maxY)):
+        ...
+"""
+import collections
+
+import numpy as np
+import rasterio
+from rasterio.windows import Window
+
+NATIVE_PIXELS_PER_DEG = 1200  # 3 arcsecond cells
+SUMMARY_CELLS = 80  # summary grid width, so a 10 degree region is summarised in 1/8 degree cells
+MAX_DEPTH = 4  # 10 degree regions split down to 0.625 degree tiles
+
+# Densities are people per native 3ss cell (~0.008 km² at the equator), so thresholds don't depend on region size
+SPLIT_DENSITY = 5.0  # split any region averaging above this (~600/km²)
+SPLIT_CV = 2.0  # or whose cells vary this much (std / mean), i.e. towns and cities over countryside
+DENSE_CELL_DENSITY = 20.0  # ...as long as its densest summary cell is at least urban (~2500/km²)
+SPARSE_DENSITY = 0.1  # regions below this (~12/km²) are stored coarse
+
+RESOLUTIONS = {  # tile width in pixels, capped at native
+    "populated": 2**13,  # any leaf that isn't sparse, never coarser than the fixed num_pixels tiles in data formatting.py
+    "sparse": 2**10,
+    "empty": 2**8,
+}
+
+Leaf = collections.namedtuple("Leaf", ["path", "bounds", "num_pixels", "population"])
+
+
+def native_pixels(bounds):
+    """
+    Width of a region in native 3ss pixels
+    """
+    return int(round((bounds[2] - bounds[0]) * NATIVE_PIXELS_PER_DEG))
+
+
+def summarise(raw_tif, cells=SUMMARY_CELLS):
+    """
+    Sum population into a cells x cells grid (row 0 is the northern edge), reading the native raster in strips
+    """
+    with rasterio.open(raw_tif) as ds:
+        cell_h = -(-ds.height // cells)
+        cell_w = -(-ds.width // cells)
+        grid = np.zeros((cells, cells), dtype="float64")
+
+        for r in range(cells):
+            row_off = r * cell_h
+            if row_off >= ds.height:
+                break
+            arr = ds.read(1, window=Window(0, row_off, ds.width, min(cell_h, ds.height - row_off))).astype("float64")
+
+            invalid = ~np.isfinite(arr) | (arr < 0)
+            if ds.nodata is not None:
+                invalid |= arr == ds.nodata
+            arr[invalid] = 0
+
+            arr = np.pad(arr, ((0, 0), (0, cell_w * cells - ds.width)))
+            grid[r] = arr.reshape(arr.shape[0], cells, cell_w).sum(axis=(0, 2))
+
+    return grid
+
+
+def plan_tiles(grid, bounds, resolutions=RESOLUTIONS, max_depth=MAX_DEPTH, path=""):
+    """
+    Split a region into leaf tiles from its summary grid. Returns a list of Leaf.
+    """
+    minX, minY, maxX, maxY = bounds
+    rows, cols = grid.shape
+    native = native_pixels(bounds)
+
+    population = float(grid.sum())
+    cell_native = (native / max(cols, 1)) ** 2  # native pixels per summary cell
+    mean_density = population / native ** 2
+    peak_density = float(grid.max()) / cell_native if grid.size else 0.0
+    cv = float(grid.std() / grid.mean()) if population > 0 else 0.0
+
+    dense = mean_density > SPLIT_DENSITY or (cv > SPLIT_CV and peak_density > DENSE_CELL_DENSITY)
+    if dense and len(path) < max_depth and rows >= 2 and cols >= 2:
+        midX, midY = (minX + maxX) / 2, (minY + maxY) / 2
+        hr, hc = rows // 2, cols // 2
+        quadrants = [
+            ("0", grid[hr:, :hc], (minX, minY, midX, midY)),  # SW, southern rows are at the bottom of the grid
+            ("1", grid[hr:, hc:], (midX, minY, maxX, midY)),  # SE
+            ("2", grid[:hr, :hc], (minX, midY, midX, maxY)),  # NW
+            ("3", grid[:hr, hc:], (midX, midY, maxX, maxY)),  # NE
+        ]
+        leaves = []
+        for digit, sub_grid, sub_bounds in quadrants:
+            leaves.extend(plan_tiles(sub_grid, sub_bounds, resolutions, max_depth, path + digit))
+        return leaves
+
+    if population == 0:
+        num_pixels = resolutions["empty"]
+    elif mean_density < SPARSE_DENSITY:
+        num_pixels = resolutions["sparse"]
+    else:
+        num_pixels = resolutions["populated"]
+
+    return [Leaf(path, bounds, min(native, num_pixels), population)]
@@ -0,0 +1,394 @@
+"""
+End-to-end benchmark of the tiling, extraction, query and upload pipeline, run against a synthetic GHS-like raster.
+
+Each stage is run --repeats times and its median time recorded. Every run is appended to a JSON history file and
+compared against the most recent run with the same parameters and I/O profile, so regressions show up.
+
+Usage:
+    python benchmark.py [--size-deg 1] [--num-pixels 1024] [--repeats 3] [--history bench_history.json]
+
+To measure the effect of the GDAL I/O profiles, compare against a run with tuning disabled:
+    MAPPOP_IO_PROFILE=none python benchmark.py
+"""
+import argparse
+import importlib.util
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+import rasterio
+from rasterio.transform import from_origin
+from shapely.geometry import Point
+
+import instrumentation as inst
+from io_profiles import io_profile
+from population_query import polygon_population
+from tile_catalog import TileCatalog, CATALOG_NAME
+from adaptive_tiling import RESOLUTIONS
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+ARCHIVED_DIR = os.path.join(BACKEND_DIR, "..", "archived")
+
+# ==== CONFIG ====
+NATIVE_RES = 3 / 3600  # 3 arcseconds, in degrees
+GHS_NODATA = -200
+ORIGIN_LON = 144  # synthetic tile lower-left corner
+ORIGIN_LAT = -38
+NUM_CITIES = 8
+LARGEST_CITY = 2_000_000  # people, the rest follow Zipf's law (1M, 667k, ...)
+RURAL_ZONES = {  # share of land, chance a cell is populated, mean people in a populated cell
+    "wilderness": (0.3, 0.0, 0.0),
+    "outback": (0.3, 0.01, 2.0),  # ~0.02 people per cell, ~3/km²
+    "farmland": (0.4, 0.1, 3.0),  # ~0.3 people per cell, ~45/km²
+}
+QUERY_RADII = [0.01, 0.05, 0.25]  # polygon radii in degrees
+REGRESSION_THRESHOLD = 1.2  # flag stages that get 20% slower than the previous comparable run
+REGRESSION_MIN_SECONDS = 0.01  # ...and by more than this, so millisecond stages don't flag on timer noise
+BENCH_BUCKET = "bench-tiles"
+COMPARABLE_PARAMS = ["size_deg", "num_pixels", "seed"]  # runs are only compared if these match
+# ===============
+
+
+def load_script(name, filename):
+    """
+    Import one of the backend scripts by path, since their file names are not valid module names
+    """
+    spec = importlib.util.spec_from_file_location(name, os.path.join(BACKEND_DIR, filename))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def measure(results, stage, fn, units, unit_name, repeats=1):
+    """
+    Run fn repeats times, recording the median wall time and throughput, and the peak RSS and bytes read/written of
+    the last run, under the given stage name. units is the amount of work done, or a callable taking fn's return value.
+    """
+    times = []
+    for _ in range(repeats):
+        with inst.track_peak_rss() as rss:
+            read_before, written_before = inst.io_bytes()
+            start = time.perf_counter()
+            value = fn()
+            times.append(time.perf_counter() - start)
+            read_after, written_after = inst.io_bytes()
+    elapsed = statistics.median(times)
+
+    units = units(value) if callable(units) else units
+    results[stage] = {
+        "seconds": elapsed,
+        "runs": times,
+        "throughput": units / elapsed if elapsed > 0 else None,
+        "unit": f"{unit_name}/s",
+        "peak_rss_mb": None if rss["bytes"] is None else rss["bytes"] / 1024 / 1024,  # during this stage only
+        "bytes_read": None if read_before is None else read_after - read_before,
+        "bytes_written": None if written_before is None else written_after - written_before,
+    }
+    print(f"{stage:<24} {elapsed:8.3f}s  {results[stage]['throughput'] or 0:14.1f} {unit_name}/s  {results[stage]['peak_rss_mb'] or 0:8.1f} MB peak")
+    return value
+
+
+# -------------------------
+# Synthetic Data
+# -------------------------
+def generate_synthetic_raster(path, size_deg, seed=0):
+    """
+    Write a GHS-like population raster covering size_deg x size_deg degrees at 3 arcsecond resolution.
+
+    Water is nodata. Land is split into blocky wilderness, outback and farmland zones with rural densities in the GHS
+    range (RURAL_ZONES), and a handful of Zipf-sized cities decay outwards from dense cores, so the fixture has dense,
+    sparse and empty regions for adaptive tiling to tell apart.
+    Returns the list of city centres as (lon, lat, radius_px), largest first.
+    """
+    rng = np.random.default_rng(seed)
+    n = int(round(size_deg / NATIVE_RES))
+    cell_km2 = (NATIVE_RES * 111.32) ** 2 * np.cos(np.radians(ORIGIN_LAT + size_deg / 2))
+
+    def blocks(blocks_per_deg):
+        """
+        Uniform random values constant over square blocks, for coastlines and zones
+        """
+        count = max(1, int(blocks_per_deg * size_deg))
+        size = -(-n // count)
+        return np.kron(rng.random((count, count)), np.ones((size, size)))[:n, :n]
+
+    # Blocky coastline, roughly 70% land
+    land = blocks(8) < 0.7
+
+    # Rural population by zone, most land cells are empty
+    pop = np.zeros((n, n), dtype="float32")
+    zone = blocks(16)
+    lower = 0.0
+    for share, populated, mean in RURAL_ZONES.values():
+        in_zone = land & (zone >= lower) & (zone < lower + share)
+        lower += share
+        if populated:
+            settled = in_zone & (rng.random((n, n)) < populated)
+            pop[settled] = rng.exponential(mean, int(settled.sum()))
+
+    cities = []
+    land_rows, land_cols = np.nonzero(land)
+    for rank in range(1, NUM_CITIES + 1):
+        idx = rng.integers(len(land_rows))
+        row, col = int(land_rows[idx]), int(land_cols[idx])
+
+        # Zipf-sized cities, e-folding radius 5 km * sqrt(millions of people), so 2M people peak at ~6,400/km²
+        total = LARGEST_CITY / rank
+        radius = max(3.0, 5.0 * np.sqrt(total / 1e6) / np.sqrt(cell_km2))
+        peak = total / (2 * np.pi * radius ** 2)  # exp(-r / radius) integrates to 2 pi radius² cells
+
+        r0, r1 = max(0, int(row - 6 * radius)), min(n, int(row + 6 * radius) + 1)
+        c0, c1 = max(0, int(col - 6 * radius)), min(n, int(col + 6 * radius) + 1)
+        yy, xx = np.mgrid[r0:r1, c0:c1]
+        dist = np.hypot(yy - row, xx - col)
+        pop[r0:r1, c0:c1] += (peak * np.exp(-dist / radius)).astype("float32")
+
+        lon = ORIGIN_LON + (col + 0.5) * NATIVE_RES
+        lat = ORIGIN_LAT + size_deg - (row + 0.5) * NATIVE_RES
+        cities.append((lon, lat, radius))
+
+    pop[~land] = GHS_NODATA
+
+    with rasterio.open(
+        path, "w",
+        driver="GTiff",
+        width=n, height=n, count=1,
+        dtype="float32",
+        crs="EPSG:4326",
+        transform=from_origin(ORIGIN_LON, ORIGIN_LAT + size_deg, NATIVE_RES, NATIVE_RES),
+        nodata=GHS_NODATA,
+        tiled=True, blockxsize=256, blockysize=256,
+        compress="LZW"
+    ) as ds:
+        ds.write(pop, 1)
+
+    return cities
+
+
+# -------------------------
+# Stages
+# -------------------------
+def bench_formatting(results, formatting, src_tif, work_dir, cog_dir, size_deg, num_pixels, repeats=1):
+    """
+    Time each stage of data formatting.py on the synthetic tile
+    """
+    minX, maxX = ORIGIN_LON, ORIGIN_LON + size_deg
+    minY, maxY = ORIGIN_LAT, ORIGIN_LAT + size_deg
+    native_pixels = int(round(size_deg / NATIVE_RES)) ** 2
+
+    temp_raw = os.path.join(work_dir, "temp_raw.tif")
+    temp_resampled = os.path.join(work_dir, "temp_resampled.tif")
+    final_cog = os.path.join(cog_dir, f"tile_([{minX},{maxX}],[{minY},{maxY}]).tif")
+
+    with io_profile("bulk-build"):
+        measure(results, "crop", lambda: formatting.crop_tile(src_tif, temp_raw, minX, maxX, minY, maxY), native_pixels, "pixels", repeats)
+        measure(results, "resample", lambda: formatting.resample_tile(temp_raw, temp_resampled, num_pixels), native_pixels, "pixels", repeats)
+        measure(results, "round", lambda: formatting.round_tile(temp_resampled), num_pixels ** 2, "pixels", repeats)
+        measure(results, "cog_write", lambda: formatting.write_cog(temp_resampled, final_cog), num_pixels ** 2, "pixels", repeats)
+
+
+def bench_extraction(results, src_tif, work_dir, cities, repeats=1):
+    """
+    Time the archived ExtractTif GeoDataFrame extraction
+    """
+    sys.path.insert(0, os.path.abspath(ARCHIVED_DIR))
+    from extractParquet import ExtractTif
+
+    lon, lat, _ = cities[0]
+    measure(
+        results, "extract_tif",
+        lambda: ExtractTif(input_paths=src_tif, output_path=os.path.join(work_dir, "extract.parquet"), lat_middle=lat, lon_middle=lon),
+        lambda extractor: len(extractor.gdf), "points", repeats
+    )
+
+
+def bench_adaptive(results, formatting, src_tif, work_dir, size_deg, num_pixels, repeats=1):
+    """
+    Time adaptive tiling of the synthetic tile. Tile widths are scaled by --num-pixels the same way the fixed tile is.
+    """
+    minX, maxX = ORIGIN_LON, ORIGIN_LON + size_deg
+    minY, maxY = ORIGIN_LAT, ORIGIN_LAT + size_deg
+    native_pixels = int(round(size_deg / NATIVE_RES)) ** 2
+
+    adaptive_dir = os.path.join(work_dir, "adaptive_tiles")
+    os.makedirs(adaptive_dir)
+    catalog = TileCatalog(adaptive_dir)
+
+    scale = num_pixels / formatting.num_pixels
+    resolutions = {k: max(1, int(v * scale)) for k, v in RESOLUTIONS.items()}
+
+    with io_profile("bulk-build"):
+        leaves = measure(
+            results, "adaptive_build",
+            lambda: formatting.tile_region(src_tif, work_dir, adaptive_dir, catalog, minX, maxX, minY, maxY, adaptive=True, resolutions=resolutions),
+            native_pixels, "pixels", repeats
+        )
+    results["adaptive_build"]["tiles"] = len(leaves)
+    results["adaptive_build"]["tile_bytes"] = int(catalog.nbytes.sum())
+    return catalog
+
+
+def bench_catalog(results, cog_dir, repeats=1):
+    """
+    Time building, saving and loading the tile catalog
+    """
+    catalog_path = os.path.join(cog_dir, CATALOG_NAME)
+    catalog = measure(results, "catalog_build", lambda: TileCatalog.build(cog_dir), lambda c: len(c), "tiles", repeats)
+    catalog.save(catalog_path)
+    results["catalog_build"]["tile_bytes"] = int(catalog.nbytes.sum())
+    return measure(results, "catalog_load", lambda: TileCatalog.load(catalog_path), lambda c: len(c), "tiles", repeats)
+
+
+def bench_queries(results, catalogs, src_tif, cities, repeats=1):
+    """
+    Time polygon population queries of increasing size, centred on the largest city, against each tileset.
+    Error is relative to the same query on the native resolution source raster.
+    """
+    native = TileCatalog(os.path.dirname(src_tif))
+    native.add(src_tif)
+    lon, lat, _ = cities[0]
+
+    for radius in QUERY_RADII:
+        polygon = Point(lon, lat).buffer(radius, quad_segs=16)
+        truth = polygon_population(native, polygon)
+
+        for label, catalog in catalogs.items():
+            stage = f"query_{label}_r{radius}"
+            population = measure(results, stage, lambda: polygon_population(catalog, polygon), 1, "queries", repeats)
+            results[stage]["population"] = population
+            results[stage]["error"] = abs(population - truth) / truth if truth else None
+
+
+def bench_upload(results, cog_dir, repeats=1):
+    """
+    Time the upload path against a local moto S3 server
+    """
+    try:
+        from moto.server import ThreadedMotoServer
+    except ImportError:
+        print("moto not installed, skipping upload benchmark")
+        return
+
+    server = ThreadedMotoServer(port=0)
+    server.start()
+    host, port = server.get_host_and_port()
+
+    os.environ.update({
+        "R2_ENDPOINT": f"http://{host}:{port}",
+        "R2_ACCESS_KEY": "bench",
+        "R2_SECRET_KEY": "bench",
+        "BUCKET_NAME": BENCH_BUCKET,
+    })
+
+    try:
+        uploader = load_script("upload_files", "upload files.py")
+        uploader.s3.create_bucket(Bucket=BENCH_BUCKET)
+        uploader.LOCAL_DIRECTORY = cog_dir
+
+        total_bytes = sum(os.path.getsize(p) for p, _ in uploader.walk_all_files(cog_dir))
+        measure(results, "upload", uploader.main, total_bytes, "bytes", repeats)
+    finally:
+        server.stop()
+
+
+# -------------------------
+# History
+# -------------------------
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND_DIR, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def comparable(a, b):
+    """
+    Whether two runs did the same work: same fixture, tile size and I/O profile
+    """
+    return (a.get("io_profile", "default") == b.get("io_profile", "default")
+            and all(a["params"].get(k) == b["params"].get(k) for k in COMPARABLE_PARAMS))
+
+
+def record_history(history_path, run):
+    """
+    Append a run to the JSON history and report stages that regressed against the most recent comparable run
+    """
+    history = []
+    if os.path.exists(history_path):
+        with open(history_path) as f:
+            history = json.load(f)
+
+    baseline = next((h for h in reversed(history) if comparable(h, run)), None)
+    if baseline is None:
+        print(f"\nNo earlier run with the same {', '.join(COMPARABLE_PARAMS)} and I/O profile to compare against")
+    else:
+        previous = baseline["stages"]
+        print(f"\nCompared to run at {baseline['timestamp']} ({baseline['commit']}, I/O profile {baseline.get('io_profile', 'default')}):")
+        for stage, stats in run["stages"].items():
+            if stage not in previous:
+                continue
+            ratio = stats["seconds"] / previous[stage]["seconds"] if previous[stage]["seconds"] else 1.0
+            slower = stats["seconds"] - previous[stage]["seconds"]
+            flag = "  <-- REGRESSION" if ratio > REGRESSION_THRESHOLD and slower > REGRESSION_MIN_SECONDS else ""
+            print(f"  {stage:<24} {ratio:6.2f}x{flag}")
+
+    history.append(run)
+    with open(history_path, "w") as f:
+        json.dump(history, f, indent=2)
+    print(f"\nSaved run to {history_path}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the population tiling pipeline on synthetic data")
+    parser.add_argument("--size-deg", type=int, default=1, help="Width of the synthetic tile in degrees")
+    parser.add_argument("--num-pixels", type=int, default=2**10, help="Resampled tile width, as num_pixels in data formatting.py")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeats", type=int, default=3, help="Times to run each stage, the median is recorded")
+    parser.add_argument("--history", default="bench_history.json")
+    parser.add_argument("--skip", nargs="*", default=[], choices=["extract", "upload"], help="Stages to skip")
+    args = parser.parse_args()
+
+    formatting = load_script("data_formatting", "data formatting.py")
+    results = {}
+
+    work_dir = tempfile.mkdtemp(prefix="mappop_bench_")
+    cog_dir = os.path.join(work_dir, "cog_tiles")
+    os.makedirs(cog_dir)
+
+    try:
+        src_tif = os.path.join(work_dir, "synthetic_ghs.tif")
+        print(f"Generating {args.size_deg}x{args.size_deg} degree synthetic raster...")
+        cities = generate_synthetic_raster(src_tif, args.size_deg, args.seed)
+
+        bench_formatting(results, formatting, src_tif, work_dir, cog_dir, args.size_deg, args.num_pixels, args.repeats)
+        if "extract" not in args.skip:
+            bench_extraction(results, src_tif, work_dir, cities, args.repeats)
+        catalogs = {
+            "fixed": bench_catalog(results, cog_dir, args.repeats),
+            "adaptive": bench_adaptive(results, formatting, src_tif, work_dir, args.size_deg, args.num_pixels, args.repeats),
+        }
+        bench_queries(results, catalogs, src_tif, cities, args.repeats)
+        if "upload" not in args.skip:
+            bench_upload(results, cog_dir, args.repeats)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    run = {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "commit": git_commit(),
+        "params": vars(args),
+        "io_profile": os.getenv("MAPPOP_IO_PROFILE", "default"),
+        "stages": results,
+        "instrumentation": inst.metrics.snapshot(),
+    }
+    record_history(args.history, run)
+
+
+if __name__ == "__main__":
+    main()
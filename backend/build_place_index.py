@@ -0,0 +1,233 @@
+"""
+Build the offline place index used by the search box in index.html, from GeoNames dumps (https://download.geonames.org/export/dump/).
+
+    python build_place_index.py cities15000.txt --admin1 admin1CodesASCII.txt --countries countryInfo.txt --out ../places.bin
+    python build_place_index.py --check "melb" ../places.bin
+
+Cities come straight from the dump. States/provinces (admin1) and countries have no coordinates in GeoNames, so they are
+placed at the population-weighted centre of their cities.
+
+File format (little-endian), records sorted by key so a prefix search is a binary search plus a forward scan:
+    header   "MPPL", u16 version, u16 reserved, u32 record count, u32 string bytes
+    records  count x (u32 key offset, u32 label offset, u16 label length, u8 key length, u8 kind,
+                      i32 lat * 1e5, i32 lon * 1e5, u32 population)
+    strings  UTF-8 keys and labels, each label stored once
+Keys are normalised names (see normalise), one record per distinct name or ASCII name of a place.
+"""
+import argparse
+import collections
+import struct
+import unicodedata
+
+MAGIC = b"MPPL"
+VERSION = 1
+HEADER = struct.Struct("<4sHHII")
+RECORD = struct.Struct("<IIHBBiiI")
+COORD_SCALE = 1e5
+MAX_KEY_BYTES = 255
+
+KIND_CITY = 0
+KIND_ADMIN1 = 1
+KIND_COUNTRY = 2
+
+Place = collections.namedtuple("Place", ["names", "label", "lat", "lon", "population", "kind"])
+Match = collections.namedtuple("Match", ["label", "lat", "lon", "population", "kind"])
+
+
+def normalise(text):
+    """
+    Lowercase, strip accents and other marks and collapse whitespace. index.html applies the same steps to queries,
+    dropping every Unicode mark (\p{M}), so this must too, including spacing marks such as Devanagari vowel signs.
+    """
+    text = unicodedata.normalize("NFKD", text)
+    text = "".join(c for c in text if not unicodedata.category(c).startswith("M"))
+    return " ".join(text.lower().split())
+
+
+# -------------------------
+# GeoNames Parsing
+# -------------------------
+def read_admin1(path):
+    """
+    {"AU.07": "Victoria", ...} from admin1CodesASCII.txt
+    """
+    names = {}
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            cols = line.rstrip("\n").split("\t")
+            if len(cols) >= 2:
+                names[cols[0]] = cols[1]
+    return names
+
+
+def read_countries(path):
+    """
+    {"AU": "Australia", ...} from countryInfo.txt
+    """
+    names = {}
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if line.startswith("#"):
+                continue
+            cols = line.rstrip("\n").split("\t")
+            if len(cols) >= 5:
+                names[cols[0]] = cols[4]
+    return names
+
+
+def read_places(cities_path, admin1=None, countries=None, min_population=0):
+    """
+    Places from a GeoNames cities file, plus admin1 areas and countries placed at the weighted centre of their cities
+    """
+    admin1 = admin1 or {}
+    countries = countries or {}
+    places = []
+    regions = collections.defaultdict(lambda: [0.0, 0.0, 0, 0])  # {(kind, code): [sum lat * w, sum lon * w, sum w, population]}
+
+    with open(cities_path, encoding="utf-8") as f:
+        for line in f:
+            cols = line.rstrip("\n").split("\t")
+            if len(cols) < 15:
+                continue
+
+            name, ascii_name = cols[1], cols[2]
+            lat, lon = float(cols[4]), float(cols[5])
+            country_code, admin1_code = cols[8], f"{cols[8]}.{cols[10]}"
+            population = int(cols[14] or 0)
+            if population < min_population:
+                continue
+
+            label = ", ".join(filter(None, [name, admin1.get(admin1_code), countries.get(country_code, country_code)]))
+            places.append(Place({name, ascii_name}, label, lat, lon, population, KIND_CITY))
+
+            weight = max(population, 1)  # places without a population still count towards the centre
+            for key in ((KIND_ADMIN1, admin1_code), (KIND_COUNTRY, country_code)):
+                region = regions[key]
+                region[0] += lat * weight
+                region[1] += lon * weight
+                region[2] += weight
+                region[3] += population
+
+    for (kind, code), (lat_sum, lon_sum, weight, population) in regions.items():
+        if kind == KIND_ADMIN1 and code in admin1:
+            country = countries.get(code.split(".")[0], code.split(".")[0])
+            places.append(Place({admin1[code]}, f"{admin1[code]}, {country}", lat_sum / weight, lon_sum / weight, population, kind))
+        elif kind == KIND_COUNTRY and code in countries:
+            places.append(Place({countries[code]}, countries[code], lat_sum / weight, lon_sum / weight, population, kind))
+
+    return places
+
+
+# -------------------------
+# Index File
+# -------------------------
+def write_index(places, path):
+    """
+    Write places as a sorted, prefix-searchable binary index. Returns the number of records.
+    """
+    strings = bytearray()
+    offsets = {}
+
+    def intern(text):
+        data = text.encode("utf-8")
+        if data not in offsets:
+            offsets[data] = len(strings)
+            strings.extend(data)
+        return offsets[data], len(data)
+
+    records = []
+    for place in places:
+        label_offset, label_len = intern(place.label)
+        for key in {normalise(n) for n in place.names if n}:
+            key_bytes = key.encode("utf-8")[:MAX_KEY_BYTES].decode("utf-8", "ignore").encode("utf-8")
+            records.append((key_bytes, label_offset, label_len, place))
+
+    records.sort(key=lambda r: (r[0], -r[3].population))
+
+    with open(path, "wb") as f:
+        packed = bytearray()
+        for key_bytes, label_offset, label_len, place in records:
+            key_offset, key_len = intern(key_bytes.decode("utf-8"))
+            packed += RECORD.pack(
+                key_offset, label_offset, label_len, key_len, place.kind,
+                round(place.lat * COORD_SCALE), round(place.lon * COORD_SCALE), min(place.population, 2**32 - 1)
+            )
+        f.write(HEADER.pack(MAGIC, VERSION, 0, len(records), len(strings)))
+        f.write(packed)
+        f.write(strings)
+
+    return len(records)
+
+
+class PlaceIndex:
+    """
+    Reader for the binary index, mirroring the search in index.html so the index can be checked offline
+    """
+    def __init__(self, path):
+        with open(path, "rb") as f:
+            data = f.read()
+
+        magic, version, _, self.count, string_bytes = HEADER.unpack_from(data, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{path} is not a version {VERSION} place index")
+
+        self.records = [RECORD.unpack_from(data, HEADER.size + i * RECORD.size) for i in range(self.count)]
+        start = HEADER.size + self.count * RECORD.size
+        self.strings = data[start:start + string_bytes]
+
+    def key(self, i):
+        key_offset, _, _, key_len = self.records[i][:4]
+        return self.strings[key_offset:key_offset + key_len]
+
+    def search(self, query, limit=7):
+        """
+        Places whose name starts with query, most populous first
+        """
+        prefix = normalise(query).encode("utf-8")
+        if not prefix:
+            return []
+
+        lo, hi = 0, self.count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.key(mid) < prefix:
+                lo = mid + 1
+            else:
+                hi = mid
+
+        matches = {}
+        i = lo
+        while i < self.count and self.key(i).startswith(prefix):
+            _, label_offset, label_len, _, kind, lat, lon, population = self.records[i]
+            label = self.strings[label_offset:label_offset + label_len].decode("utf-8")
+            matches.setdefault(label, Match(label, lat / COORD_SCALE, lon / COORD_SCALE, population, kind))
+            i += 1
+
+        return sorted(matches.values(), key=lambda m: -m.population)[:limit]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the offline place index for the search box")
+    parser.add_argument("cities", help="GeoNames cities file (e.g. cities15000.txt), or the index to search with --check")
+    parser.add_argument("--admin1", help="GeoNames admin1CodesASCII.txt")
+    parser.add_argument("--countries", help="GeoNames countryInfo.txt")
+    parser.add_argument("--min-population", type=int, default=0)
+    parser.add_argument("--out", default="places.bin")
+    parser.add_argument("--check", metavar="QUERY", help="Search an existing index instead of building one")
+    args = parser.parse_args()
+
+    if args.check:
+        for match in PlaceIndex(args.cities).search(args.check):
+            print(f"{match.label} ({match.lat:.4f}, {match.lon:.4f}) population {match.population}")
+        return
+
+    admin1 = read_admin1(args.admin1) if args.admin1 else {}
+    countries = read_countries(args.countries) if args.countries else {}
+    places = read_places(args.cities, admin1, countries, args.min_population)
+
+    count = write_index(places, args.out)
+    print(f"Wrote {count} records for {len(places)} places to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
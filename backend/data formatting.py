@@ -4,54 +4,55 @@ import numpy as np
 import os
 import time
 
+import instrumentation as inst
+from io_profiles import io_profile
+from tile_catalog import TileCatalog, array_stats, cell_scale, CATALOG_NAME, CATALOG_JSON_NAME
+from adaptive_tiling import Leaf, RESOLUTIONS, native_pixels, plan_tiles, summarise
+
 #Convert Tif and Overviews to a COG
 input_tif = "./GHS_POP_E2025_GLOBE_R2023A_4326_3ss_V1_0/GHS_POP_E2025_GLOBE_R2023A_4326_3ss_V1_0.tif"
 output_dir = "cog_tiles"
-os.makedirs(output_dir, exist_ok=True)
-
 
-# Loop longitude (-180 to 170)
 tile_size = 10
 num_pixels = 2**13
 pixel_size = (tile_size*3600) / num_pixels
-for lon in range(-180, 180, tile_size):
-
-    # Loop latitude (-90 to 90)
-    for lat in range(-90, 90, tile_size):
-        
-        minX, maxX = lon, lon + tile_size
-        minY, maxY = lat, lat + tile_size
-
-        print(f"Processing Tile [{minX},{maxX}],[{minY},{maxY}]")
-        start_time = time.time()
-        
-        tile_name = f"tile_([{minX},{maxX}],[{minY},{maxY}]).tif"
+adaptive = True  # split dense regions into finer tiles (see adaptive_tiling.py), otherwise every tile is num_pixels wide
 
-        temp_raw = os.path.join(output_dir, "temp_raw.tif")
-        temp_resampled = os.path.join(output_dir, "temp_resampled.tif")
 
-        final_cog = os.path.join(output_dir, tile_name)
-
-        # Extract 5×5 degree window
+def crop_tile(src_tif, dst_tif, minX, maxX, minY, maxY):
+    """
+    Extract the [minX, maxX] x [minY, maxY] degree window from the source raster
+    """
+    with inst.stage("crop"):
         gdal.Translate(
-            temp_raw,
-            input_tif,
+            dst_tif,
+            src_tif,
             projWin=[minX, maxY, maxX, minY],
             format="GTiff"
         )
 
-        # Resample tile to target resolution
+
+def resample_tile(src_tif, dst_tif, num_pixels):
+    """
+    Resample a tile to num_pixels x num_pixels
+    """
+    with inst.stage("resample"):
         gdal.Translate(
-            temp_resampled,
-            temp_raw,
+            dst_tif,
+            src_tif,
             width=num_pixels,
             height=num_pixels,
             resampleAlg="bilinear",
             format="GTiff"
         )
 
-        # Round values to improve storage efficiency
-        with rasterio.open(temp_resampled, "r+") as ds:
+
+def round_tile(tif_path):
+    """
+    Round values in place to improve storage efficiency. Returns the tile's array_stats for the catalog.
+    """
+    with inst.stage("round"):
+        with rasterio.open(tif_path, "r+") as ds:
             arr = ds.read(1)
 
             arr = np.round(arr, 2)    # 2 decimal places
@@ -59,10 +60,19 @@ for lon in range(-180, 180, tile_size):
 
             ds.write(arr, 1)
 
-        # Convert to COG
+            if ds.nodata is not None:
+                arr[arr == ds.nodata] = -1
+            return array_stats(arr, cell_scale(ds.res)) or (0.0, 0.0, 0.0, 0)
+
+
+def write_cog(src_tif, dst_cog):
+    """
+    Convert a GTiff into a COG with overviews
+    """
+    with inst.stage("cog_write"):
         gdal.Translate(
-            final_cog,
-            temp_resampled,
+            dst_cog,
+            src_tif,
             format="COG",
             creationOptions=[
                 "COMPRESS=DEFLATE",
@@ -70,12 +80,98 @@ for lon in range(-180, 180, tile_size):
                 "BLOCKSIZE=512",
                 "RESAMPLING=AVERAGE",
                 "OVERVIEWS=AUTO", #Overviews all the way up to 2x2
-                "BIGTIFF=YES"
+                "BIGTIFF=YES",
+                f"NUM_THREADS={gdal.GetConfigOption('GDAL_NUM_THREADS') or 1}" #Multithreaded DEFLATE, ALL_CPUS under the bulk-build I/O profile
             ]
         )
 
-        print(f"Elapsed: {(time.time() - start_time):.1f}s")
 
-print("COG creation complete.")
+def tile_region(src_tif, work_dir, out_dir, catalog, minX, maxX, minY, maxY, adaptive=adaptive, num_pixels=num_pixels, resolutions=RESOLUTIONS):
+    """
+    Crop a region from the source raster and write it as one or more COG tiles, recording them in the catalog. Returns the leaves written.
+    """
+    temp_raw = os.path.join(work_dir, "temp_raw.tif")
+    temp_leaf = os.path.join(work_dir, "temp_leaf.tif")
+    temp_resampled = os.path.join(work_dir, "temp_resampled.tif")
+    region = (minX, minY, maxX, maxY)
+
+    # Extract the region at native resolution
+    crop_tile(src_tif, temp_raw, minX, maxX, minY, maxY)
+
+    # Split dense regions into finer tiles, or keep one tile at num_pixels
+    if adaptive:
+        with inst.stage("plan"):
+            leaves = plan_tiles(summarise(temp_raw), region, resolutions)
+    else:
+        leaves = [Leaf("", region, num_pixels, None)]
+
+    # Replace whatever tiles covered this region before
+    removed = catalog.remove_within(region)
+
+    for leaf in leaves:
+        lminX, lminY, lmaxX, lmaxY = leaf.bounds
+        tile_name = f"tile_([{lminX:g},{lmaxX:g}],[{lminY:g},{lmaxY:g}]).tif"
+        final_cog = os.path.join(out_dir, tile_name)
+
+        leaf_raw = temp_raw
+        if leaf.path:
+            leaf_raw = temp_leaf
+            crop_tile(temp_raw, leaf_raw, lminX, lmaxX, lminY, lmaxY)
+
+        # Resample tile to target resolution, unless it is kept at native
+        leaf_src = leaf_raw
+        if leaf.num_pixels < native_pixels(leaf.bounds):
+            resample_tile(leaf_raw, temp_resampled, leaf.num_pixels)
+            leaf_src = temp_resampled
+
+        # Round values to improve storage efficiency
+        stats = round_tile(leaf_src)
+
+        # Convert to COG
+        write_cog(leaf_src, final_cog)
+
+        catalog.add(final_cog, stats=stats)
+        inst.count("tiles_written")
+        inst.count("cog_bytes", os.path.getsize(final_cog))
+
+    # Delete old tiles the new layout no longer uses, so they aren't left behind and uploaded
+    for key in removed:
+        if key not in catalog.key_index:
+            stale_cog = os.path.join(catalog.root, key)
+            if os.path.exists(stale_cog):
+                os.remove(stale_cog)
+                inst.count("tiles_deleted")
+
+    return leaves
+
+
+if __name__ == "__main__":
+    os.makedirs(output_dir, exist_ok=True)
+
+    catalog_path = os.path.join(output_dir, CATALOG_NAME)
+    catalog = TileCatalog.load(catalog_path) if os.path.exists(catalog_path) else TileCatalog(output_dir)
+
+    with inst.session("tiling"), io_profile("bulk-build"):
+
+        # Loop longitude (-180 to 170)
+        for lon in range(-180, 180, tile_size):
+
+            # Loop latitude (-90 to 90)
+            for lat in range(-90, 90, tile_size):
+
+                minX, maxX = lon, lon + tile_size
+                minY, maxY = lat, lat + tile_size
+
+                print(f"Processing Region [{minX},{maxX}],[{minY},{maxY}]")
+                start_time = time.time()
+
+                leaves = tile_region(input_tif, output_dir, output_dir, catalog, minX, maxX, minY, maxY)
+
+                # Save after each region so an interrupted run keeps its catalog
+                catalog.save(catalog_path)
+
+                print(f"Wrote {len(leaves)} tile/s. Elapsed: {(time.time() - start_time):.1f}s")
 
+        catalog.save_json(os.path.join(output_dir, CATALOG_JSON_NAME))
 
+    print("COG creation complete.")
@@ -2,66 +2,83 @@ import os
 from osgeo import gdal
 import rasterio
 
+import instrumentation as inst
+from io_profiles import apply_profile
+from tile_catalog import TileCatalog, CATALOG_NAME
+
 # -------------------------
 # Configuration
 # -------------------------
 output_dir = "cog_tiles"
-tile_size = 5
+world_area = 360 * 180  # square degrees the tileset should cover
 
-lon_start = -180   # your generation loop starts here
-lon_end = 180
-lat_start = -90
-lat_end = 90
+apply_profile("bulk-build")
 
 # -------------------------
 # Verification Logic
 # -------------------------
 missing_files = []
 corrupted_files = []
+mismatched_files = []
 ok_files = []
 
 print("Checking generated COG tiles...\n")
 
-for lon in range(lon_start, lon_end, tile_size):
-    for lat in range(lat_start, lat_end, tile_size):
-
-        minX = lon
-        maxX = lon + tile_size
-        minY = lat
-        maxY = lat + tile_size
-
-        tile_name = f"tile_([{minX},{maxX}],[{minY},{maxY}]).tif"
-        tile_path = os.path.join(output_dir, tile_name)
-
-        # Check 1 — File exists
-        if not os.path.exists(tile_path):
-            missing_files.append(tile_path)
-            print(f"❌ MISSING: {tile_name}")
-            continue
-
-        # Check 2 — File is readable and valid
-        ds = gdal.Open(tile_path)
-        if ds is None:
-            corrupted_files.append(tile_path)
-            print(f"⚠️ CORRUPTED (Unreadable): {tile_name}")
-            continue
-
-        # Optional: sanity check raster size > 0
-        if ds.RasterXSize == 0 or ds.RasterYSize == 0:
-            corrupted_files.append(tile_path)
-            print(f"⚠️ CORRUPTED (Empty raster): {tile_name}")
-            continue
-
-        ok_files.append(tile_path)
+# The catalog is the list of expected tiles, whatever their sizes
+catalog = TileCatalog.load(os.path.join(output_dir, CATALOG_NAME))
+
+with inst.session("validation"):
+    for i in range(len(catalog)):
+        tile = catalog.tile(i)
+        tile_name = tile.key
+        tile_path = tile.path
+
+        with inst.stage("check_tile"):
+            # Check 1 — File exists
+            if not os.path.exists(tile_path):
+                missing_files.append(tile_path)
+                inst.count("tiles_missing")
+                print(f"❌ MISSING: {tile_name}")
+                continue
+
+            # Check 2 — File is readable and valid
+            ds = gdal.Open(tile_path)
+            if ds is None:
+                corrupted_files.append(tile_path)
+                inst.count("tiles_corrupted")
+                print(f"⚠️ CORRUPTED (Unreadable): {tile_name}")
+                continue
+
+            # Optional: sanity check raster size > 0
+            if ds.RasterXSize == 0 or ds.RasterYSize == 0:
+                corrupted_files.append(tile_path)
+                inst.count("tiles_corrupted")
+                print(f"⚠️ CORRUPTED (Empty raster): {tile_name}")
+                continue
+
+            # Check 3 — File matches what the catalog recorded
+            if (ds.RasterXSize, ds.RasterYSize) != (tile.width, tile.height) or os.path.getsize(tile_path) != tile.nbytes:
+                mismatched_files.append(tile_path)
+                inst.count("tiles_mismatched")
+                print(f"⚠️ MISMATCH (Differs from catalog): {tile_name}")
+                continue
+
+            ok_files.append(tile_path)
+            inst.count("tiles_ok")
+
+# Tiles may be mixed sizes but should not overlap, so their areas should add up to the globe
+covered_area = float(((catalog.bounds[:, 2] - catalog.bounds[:, 0]) * (catalog.bounds[:, 3] - catalog.bounds[:, 1])).sum())
 
 print("\n-------------------")
 print("Verification Summary")
 print("-------------------")
 
-print(f"Total Expected Tiles: {len(ok_files) + len(missing_files) + len(corrupted_files)}")
+print(f"Total Expected Tiles: {len(catalog)}")
 print(f"✔ OK Files: {len(ok_files)}")
 print(f"❌ Missing Files: {len(missing_files)}")
 print(f"⚠️ Corrupted Files: {len(corrupted_files)}")
+print(f"⚠️ Catalog Mismatches: {len(mismatched_files)}")
+print(f"Coverage: {100 * covered_area / world_area:.2f}% of the globe")
 
 if missing_files:
     print("\nMissing tile list:")
@@ -73,6 +90,11 @@ if corrupted_files:
     for f in corrupted_files:
         print(" -", f)
 
+if mismatched_files:
+    print("\nMismatched tile list:")
+    for f in mismatched_files:
+        print(" -", f)
+
 
 # Open the TIFF
 ds = gdal.Open("./GHS_POP_E2025_GLOBE_R2023A_4326_3ss_V1_0/GHS_POP_E2025_GLOBE_R2023A_4326_3ss_V1_0.tif")
@@ -94,7 +116,7 @@ for i in range(ovr_count):
 
 print("Checking specific GOD tile")
 
-path = "./cog_tiles/tile_([115,120],[30,35]).tif"
+path = catalog.tiles_at(117.5, 32.5)[0].path
 
 with rasterio.open(path) as ds:
     print("Driver:", ds.driver)
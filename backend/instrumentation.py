@@ -0,0 +1,388 @@
+"""
+Shared instrumentation for the backend scripts: per-stage timers, byte counters, gauges and opt-in profiling.
+
+    import instrumentation as inst
+
+    with inst.session("tiling"):
+        with inst.stage("crop"):
+            ...
+        inst.count("tiles_written")
+        inst.gauge("upload_queue_depth", 12)
+
+Environment variables:
+    MAPPOP_METRICS         Path to write metrics to when the session ends (stdout if "-")
+    MAPPOP_METRICS_FORMAT  "json" (default) or "prom" for Prometheus text exposition
+    MAPPOP_PROFILER        "cprofile" to write a .prof file, or "sample" to write collapsed stacks (flamegraph.pl / speedscope / py-spy raw format)
+    MAPPOP_PROFILER_OUT    Profile output path, defaults to "<session>.prof" or "<session>.stacks"
+(Not to be confused with MAPPOP_IO_PROFILE, the GDAL settings profile in io_profiles.py.)
+
+Bytes read/written are process-wide deltas, so stages that overlap across threads share their I/O.
+
+GDAL block cache usage is read from osgeo.gdal's copy of GDAL, once as each stage exits. rasterio wheels bundle their own
+libgdal whose cache isn't visible from Python, so stages that only use rasterio report nothing.
+"""
+import cProfile
+import collections
+import contextlib
+import json
+import os
+import sys
+import threading
+import time
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+PREFIX = "mappop"
+SAMPLE_INTERVAL = 0.005  # seconds between stack samples
+PROFILER_MODES = ["cprofile", "sample"]
+
+
+# -------------------------
+# Process Counters
+# -------------------------
+def peak_rss_bytes():
+    """
+    Peak resident set size of this process so far
+    """
+    if resource is not None:
+        maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return maxrss if sys.platform == "darwin" else maxrss * 1024
+    if psutil is not None:
+        info = psutil.Process().memory_info()
+        return getattr(info, "peak_wset", info.rss)
+    return None
+
+
+def current_rss_bytes():
+    """
+    Resident set size of this process right now
+    """
+    if psutil is not None:
+        return psutil.Process().memory_info().rss
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+@contextlib.contextmanager
+def track_peak_rss(interval=SAMPLE_INTERVAL):
+    """
+    Peak RSS reached inside the block, in result["bytes"] once it exits (None if RSS can't be read).
+
+    peak_rss_bytes is a high-water mark for the whole process, so it can't tell stages apart. On Linux the kernel's
+    mark (VmHWM) is reset for the block through /proc/self/clear_refs, elsewhere RSS is polled every interval seconds.
+    """
+    result = {"bytes": None}
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        with open("/proc/self/status") as f:
+            hwm_readable = any(line.startswith("VmHWM:") for line in f)
+    except OSError:
+        hwm_readable = False
+
+    if hwm_readable:
+        try:
+            yield result
+        finally:
+            with open("/proc/self/status") as f:
+                hwm = next(line for line in f if line.startswith("VmHWM:"))
+            result["bytes"] = int(hwm.split()[1]) * 1024
+        return
+
+    peak = [current_rss_bytes()]
+    stop_event = threading.Event()
+
+    def poll():
+        while not stop_event.wait(interval):
+            peak[0] = max(peak[0], current_rss_bytes())
+
+    poller = threading.Thread(target=poll, name="mappop-rss-poller", daemon=True)
+    if peak[0] is not None:
+        poller.start()
+    try:
+        yield result
+    finally:
+        if peak[0] is not None:
+            stop_event.set()
+            poller.join()
+            result["bytes"] = max(peak[0], current_rss_bytes())
+
+
+def io_bytes():
+    """
+    Bytes read and written by this process so far, as (read, written). Includes page-cache hits, as GDAL sees them.
+    """
+    try:
+        with open("/proc/self/io") as f:
+            stats = dict(line.split(": ") for line in f.read().splitlines())
+        return int(stats["rchar"]), int(stats["wchar"])
+    except OSError:
+        pass
+    if psutil is not None:
+        counters = psutil.Process().io_counters()
+        return counters.read_bytes, counters.write_bytes
+    return None, None
+
+
+def gdal_cache_stats():
+    """
+    osgeo.gdal's block cache occupancy as (used, max) bytes, or (None, None) if osgeo.gdal isn't loaded. GDAL does not expose
+    hit/miss counters to Python, so occupancy is the closest signal. The cache of rasterio's bundled libgdal isn't covered.
+    """
+    if "osgeo.gdal" not in sys.modules: #Only report GDAL if the script is already using it
+        return None, None
+    gdal = sys.modules["osgeo.gdal"]
+    return gdal.GetCacheUsed(), gdal.GetCacheMax()
+
+
+# -------------------------
+# Metrics Registry
+# -------------------------
+class Metrics:
+    """
+    Thread-safe store of stage timings, counters and gauges
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.stages = collections.OrderedDict()
+        self.counters = collections.OrderedDict()
+        self.gauges = collections.OrderedDict()
+
+    def record_stage(self, name, seconds, bytes_read, bytes_written, gdal_cache_used):
+        with self.lock:
+            s = self.stages.setdefault(name, {
+                "calls": 0,
+                "seconds": 0.0,
+                "max_seconds": 0.0,
+                "bytes_read": 0,
+                "bytes_written": 0,
+                "gdal_cache_used_at_exit_bytes": None,  # largest across calls, osgeo.gdal only
+            })
+            s["calls"] += 1
+            s["seconds"] += seconds
+            s["max_seconds"] = max(s["max_seconds"], seconds)
+            s["bytes_read"] += bytes_read or 0
+            s["bytes_written"] += bytes_written or 0
+            if gdal_cache_used is not None:
+                s["gdal_cache_used_at_exit_bytes"] = max(s["gdal_cache_used_at_exit_bytes"] or 0, gdal_cache_used)
+
+    def count(self, name, value=1):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def gauge(self, name, value):
+        with self.lock:
+            g = self.gauges.setdefault(name, {"value": value, "max": value})
+            g["value"] = value
+            g["max"] = max(g["max"], value)
+
+    def snapshot(self):
+        """
+        Return all metrics, plus process-level counters, as a plain dict
+        """
+        cache_used, cache_max = gdal_cache_stats()
+        with self.lock:
+            return {
+                "stages": {k: dict(v) for k, v in self.stages.items()},
+                "counters": dict(self.counters),
+                "gauges": {k: dict(v) for k, v in self.gauges.items()},
+                "process": {
+                    "peak_rss_bytes": peak_rss_bytes(),
+                    "gdal_cache_used_bytes": cache_used,
+                    "gdal_cache_max_bytes": cache_max,
+                },
+            }
+
+    def to_json(self):
+        return json.dumps(self.snapshot(), indent=2)
+
+    def to_prometheus(self):
+        """
+        Render metrics in the Prometheus text exposition format
+        """
+        snap = self.snapshot()
+        lines = []
+
+        stage_fields = [
+            ("calls", "stage_calls_total", "counter"),
+            ("seconds", "stage_seconds_total", "counter"),
+            ("max_seconds", "stage_max_seconds", "gauge"),
+            ("bytes_read", "stage_bytes_read_total", "counter"),
+            ("bytes_written", "stage_bytes_written_total", "counter"),
+            ("gdal_cache_used_at_exit_bytes", "stage_gdal_cache_used_at_exit_bytes", "gauge"),
+        ]
+        for field, metric, kind in stage_fields:
+            if not snap["stages"]:
+                break
+            lines.append(f"# TYPE {PREFIX}_{metric} {kind}")
+            for name, s in snap["stages"].items():
+                if s[field] is not None:
+                    lines.append(f'{PREFIX}_{metric}{{stage="{name}"}} {s[field]}')
+
+        for name, value in snap["counters"].items():
+            lines.append(f"# TYPE {PREFIX}_{name}_total counter")
+            lines.append(f"{PREFIX}_{name}_total {value}")
+
+        for name, g in snap["gauges"].items():
+            lines.append(f"# TYPE {PREFIX}_{name} gauge")
+            lines.append(f"{PREFIX}_{name} {g['value']}")
+            lines.append(f"# TYPE {PREFIX}_{name}_max gauge")
+            lines.append(f"{PREFIX}_{name}_max {g['max']}")
+
+        for name, value in snap["process"].items():
+            if value is not None:
+                lines.append(f"# TYPE {PREFIX}_{name} gauge")
+                lines.append(f"{PREFIX}_{name} {value}")
+
+        return "\n".join(lines) + "\n"
+
+    def write(self, path, fmt="json"):
+        text = self.to_prometheus() if fmt == "prom" else self.to_json()
+        if path == "-":
+            print(text)
+            return
+        with open(path, "w") as f:
+            f.write(text)
+
+    def summary(self):
+        """
+        Human readable per-stage table, slowest total first
+        """
+        snap = self.snapshot()
+        lines = [f"{'Stage':<24}{'Calls':>7}{'Total (s)':>12}{'Max (s)':>10}{'Read (MB)':>12}{'Written (MB)':>14}"]
+        for name, s in sorted(snap["stages"].items(), key=lambda kv: -kv[1]["seconds"]):
+            lines.append(
+                f"{name:<24}{s['calls']:>7}{s['seconds']:>12.2f}{s['max_seconds']:>10.2f}"
+                f"{s['bytes_read'] / 1e6:>12.1f}{s['bytes_written'] / 1e6:>14.1f}"
+            )
+        return "\n".join(lines)
+
+
+metrics = Metrics()
+
+
+@contextlib.contextmanager
+def stage(name, registry=None):
+    """
+    Time a block of work and attribute its I/O to the named stage
+    """
+    registry = registry or metrics
+    read_before, written_before = io_bytes()
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        read_after, written_after = io_bytes()
+        registry.record_stage(
+            name,
+            elapsed,
+            None if read_before is None else read_after - read_before,
+            None if written_before is None else written_after - written_before,
+            gdal_cache_stats()[0],
+        )
+
+
+def count(name, value=1):
+    metrics.count(name, value)
+
+
+def gauge(name, value):
+    metrics.gauge(name, value)
+
+
+# -------------------------
+# Profiling
+# -------------------------
+class StackSampler:
+    """
+    Low-overhead sampling profiler. Periodically records the stack of every thread and writes them as collapsed stacks,
+    one "frame;frame;frame count" line each, which flamegraph.pl, speedscope and py-spy's raw format all read.
+    """
+    def __init__(self, interval=SAMPLE_INTERVAL):
+        self.interval = interval
+        self.samples = collections.Counter()
+        self.stop_event = threading.Event()
+        self.thread = threading.Thread(target=self.run, name="mappop-stack-sampler", daemon=True)
+
+    def run(self):
+        own_id = threading.get_ident()
+        names = {}
+        while not self.stop_event.wait(self.interval):
+            names.update({t.ident: t.name for t in threading.enumerate()})
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+                    frame = frame.f_back
+                stack.append(names.get(thread_id, str(thread_id)))
+                self.samples[";".join(reversed(stack))] += 1
+
+    def start(self):
+        self.thread.start()
+
+    def stop(self, path):
+        self.stop_event.set()
+        self.thread.join()
+        with open(path, "w") as f:
+            for stack, n in self.samples.most_common():
+                f.write(f"{stack} {n}\n")
+
+
+@contextlib.contextmanager
+def profiled(name, mode=None, out=None):
+    """
+    Profile a block with cProfile ("cprofile") or the stack sampler ("sample"). Does nothing if mode is None or empty.
+    """
+    if mode and mode not in PROFILER_MODES:
+        raise ValueError(f"Unknown profiler '{mode}'. Choose from: {', '.join(PROFILER_MODES)}")
+
+    if mode == "cprofile":
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            yield
+        finally:
+            profiler.disable()
+            profiler.dump_stats(out or f"{name}.prof")
+            print(f"Wrote cProfile stats to {out or f'{name}.prof'}")
+    elif mode == "sample":
+        sampler = StackSampler()
+        sampler.start()
+        try:
+            yield
+        finally:
+            sampler.stop(out or f"{name}.stacks")
+            print(f"Wrote sampled stacks to {out or f'{name}.stacks'}")
+    else:
+        yield
+
+
+@contextlib.contextmanager
+def session(name):
+    """
+    Wrap a script's main body: applies MAPPOP_PROFILER, then prints a stage summary and writes MAPPOP_METRICS on exit
+    """
+    with profiled(name, os.getenv("MAPPOP_PROFILER"), os.getenv("MAPPOP_PROFILER_OUT")):
+        try:
+            with stage(name):
+                yield metrics
+        finally:
+            print("\n" + metrics.summary())
+            path = os.getenv("MAPPOP_METRICS")
+            if path:
+                metrics.write(path, os.getenv("MAPPOP_METRICS_FORMAT", "json"))
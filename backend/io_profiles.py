@@ -0,0 +1,112 @@
+"""
+Named GDAL/rasterio I/O environment profiles, so every script opens datasets with the same tuned settings.
+
+    from io_profiles import io_profile
+
+    with io_profile("bulk-build"):
+        gdal.Translate(...)
+
+Profiles:
+    bulk-build    Local tiling and validation. Multithreaded DEFLATE compression for COG writes, otherwise GDAL's defaults.
+    remote-query  Reading COGs over HTTP (R2 / S3). No directory listings or sidecar probes on open, retries on transient errors.
+
+Settings are kept only when they made a measurable difference against MAPPOP_IO_PROFILE=none, or are known to scale
+with hardware the measurements ran without. On the synthetic 2 degree fixture:
+    bulk-build    A 2 GB block cache, skipping directory listings and disabling the VSI cache were all within run-to-run
+                  noise for crop, resample, round and COG writing. GDAL_NUM_THREADS=ALL_CPUS stays for COG writes,
+                  where DEFLATE compresses blocks in parallel. On the single core measured it wrote identical bytes no
+                  slower (0.59s vs 0.62s for a 2048 px COG). Its multi-core speedup is still to be measured.
+    remote-query  3 queries against one COG over S3: 10 requests with no tuning, 7 with the profile. Wall time unchanged
+                  on a local server, each request saved is a round trip to R2.
+
+MAPPOP_IO_PROFILE overrides the profile a script asks for ("none" disables tuning, for before/after comparisons).
+"""
+import contextlib
+import os
+import sys
+
+PROFILES = {
+    "bulk-build": {
+        "GDAL_NUM_THREADS": "ALL_CPUS",  # multithreaded DEFLATE in write_cog (NUM_THREADS) and GTiff
+    },
+    "remote-query": {
+        "GDAL_DISABLE_READDIR_ON_OPEN": "EMPTY_DIR",  # no LIST request against the bucket on open
+        "CPL_VSIL_CURL_ALLOWED_EXTENSIONS": ".tif",  # don't probe for .aux.xml / .ovr sidecars
+        "GDAL_HTTP_MAX_RETRY": "3",  # not a speedup, keeps a query alive through a transient 5xx
+        "GDAL_HTTP_RETRY_DELAY": "1",
+    },
+}
+
+DEFAULT_PROFILE = "bulk-build"
+
+
+def profile_for(path):
+    """
+    Pick the profile that suits a dataset path: remote-query for /vsi* network paths and URLs, bulk-build otherwise
+    """
+    remote = path.startswith(("/vsis3/", "/vsicurl/", "/vsigs/", "/vsiaz/", "http://", "https://", "s3://"))
+    return "remote-query" if remote else "bulk-build"
+
+
+def get_options(name):
+    """
+    Config options for a profile, after applying the MAPPOP_IO_PROFILE override
+    """
+    name = os.getenv("MAPPOP_IO_PROFILE", name)
+    if name in (None, "none"):
+        return {}
+    if name not in PROFILES:
+        raise ValueError(f"Unknown I/O profile '{name}'. Choose from: {', '.join(PROFILES)}")
+    return PROFILES[name]
+
+
+def apply_profile(name=DEFAULT_PROFILE):
+    """
+    Apply a profile to GDAL for the rest of the process, for top-level scripts. Returns the previous settings.
+
+    Options are set as environment variables (read by every libgdal copy, including the one bundled with rasterio wheels)
+    and on osgeo.gdal directly if it is in use.
+    """
+    options = get_options(name)
+    previous = {"env": {k: os.environ.get(k) for k in options}, "gdal": {}}
+    os.environ.update(options)
+
+    gdal = sys.modules.get("osgeo.gdal")
+    if gdal is not None and options:
+        for k, v in options.items():
+            previous["gdal"][k] = gdal.GetConfigOption(k)
+            gdal.SetConfigOption(k, v)
+
+    return previous
+
+
+def restore_profile(previous):
+    """
+    Undo apply_profile
+    """
+    for k, v in previous["env"].items():
+        if v is None:
+            os.environ.pop(k, None)
+        else:
+            os.environ[k] = v
+
+    gdal = sys.modules.get("osgeo.gdal")
+    if gdal is not None:
+        for k, v in previous["gdal"].items():
+            gdal.SetConfigOption(k, v)
+
+
+@contextlib.contextmanager
+def io_profile(name=DEFAULT_PROFILE):
+    """
+    Apply a profile to GDAL for the duration of the block, also entering rasterio.Env if rasterio is in use
+    """
+    previous = apply_profile(name)
+    options = get_options(name)
+    try:
+        with contextlib.ExitStack() as stack:
+            if "rasterio" in sys.modules and options:
+                stack.enter_context(sys.modules["rasterio"].Env(**options))
+            yield options
+    finally:
+        restore_profile(previous)
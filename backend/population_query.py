@@ -0,0 +1,60 @@
+import math
+
+import numpy as np
+import rasterio
+import rasterio.mask
+from shapely.geometry import box, mapping
+
+import instrumentation as inst
+from io_profiles import io_profile, profile_for
+from tile_catalog import cell_scale
+
+QUERY_TARGET_PIXELS = 2**22  # per tile, polygons covering more pixels are read from the coarsest overview still giving at least this many
+
+
+def polygon_population(catalog, polygon):
+    """
+    Calculate the population inside a polygon from the tiles in a TileCatalog. This is the tiled equivalent of PopulationMapApp.calculate_population.
+
+    Where tiles overlap, the finest tile is used. Tiles store population per cell at their own resolution, so resampled cells are scaled back up by their area relative to a native 3ss cell.
+    Overviews are averages of the same values, so polygons too big to read at full resolution are summed from an overview the same way.
+    """
+    total = 0.0
+
+    tiles = catalog.tiles_for(polygon)
+    if not tiles:
+        return total
+
+    tiles.sort(key=lambda t: (t.bounds[2] - t.bounds[0]) / t.width) #Finest resolution first
+    remaining = polygon
+
+    with inst.stage("query"), io_profile(profile_for(catalog.root)):
+        for tile in tiles:
+            part = remaining.intersection(box(*tile.bounds))
+            if part.area == 0: #Already covered by finer tiles, or only touches the edge
+                continue
+
+            minx, miny, maxx, maxy = part.bounds
+            factor = catalog.overview_for(tile, math.sqrt((maxx - minx) * (maxy - miny) / QUERY_TARGET_PIXELS))
+
+            inst.count("query_tiles")
+            inst.count("query_blocks", len(catalog.blocks_for(tile, part.bounds, factor)))
+            if factor > 1:
+                inst.count("query_overview_tiles")
+
+            overview = {"overview_level": tile.overviews.index(factor)} if factor > 1 else {}
+            with rasterio.open(tile.path, **overview) as ds:
+                with inst.stage("query_tile"):
+                    arr, _ = rasterio.mask.mask(ds, [mapping(part)], crop=True, filled=False)
+                inst.count("query_pixels", arr.size)
+
+                arr = np.ma.masked_invalid(arr[0])
+                arr = np.ma.masked_less(arr, 0) #GHS nodata is negative
+
+                total += float(arr.filled(0).sum()) * cell_scale(ds.res)
+
+            remaining = remaining.difference(box(*tile.bounds))
+            if remaining.is_empty:
+                break
+
+    return total
@@ -0,0 +1,428 @@
+"""
+Spatial catalog of COG tiles, replacing lookups by filename-encoded bounds.
+
+Each tile is stored with its bounds, pixel size, block size, overview factors, byte size and population stats, and indexed
+by the deepest quadtree cell (over the lon/lat world rectangle) that fully contains it. Tiles of any size can be mixed:
+a 10 degree tile sits in a shallow cell, a fine city tile in a deep one.
+
+    catalog = TileCatalog.load("cog_tiles/catalog.npz")
+    for tile in catalog.tiles_for(polygon):
+        for block_row, block_col in catalog.blocks_for(tile, polygon.bounds):
+            ...
+
+The catalog is saved as a compressed .npz of flat arrays (no pickling), which loads in a few milliseconds for thousands
+of tiles. save_json writes the subset the frontend needs.
+"""
+import collections
+import json
+import math
+import os
+
+import numpy as np
+
+CATALOG_NAME = "catalog.npz"
+CATALOG_JSON_NAME = "catalog.json"
+CATALOG_VERSION = 2  # 2: population sums are scaled to people, not summed raw cell values
+MAX_LEVEL = 16  # quadtree depth, cells of ~0.005 x 0.003 degrees
+MAX_OVERVIEWS = 16
+WORLD = (-180.0, -90.0, 180.0, 90.0)
+EDGE_EPS = 1e-9  # tiles exactly on a cell edge belong to the cell they extend into
+NATIVE_RES = 3 / 3600  # GHS-POP 3 arcsecond cells, in degrees
+
+COLUMNS = {  # flat per-tile arrays, name: (dtype, row width or None for one value per tile)
+    "bounds": ("float64", 4),
+    "sizes": ("int32", 2),  # width, height
+    "blocks": ("int32", 2),  # block width, block height
+    "overviews": ("int32", MAX_OVERVIEWS),  # decimation factors, 0 padded
+    "stats": ("float64", 4),  # min, max, population, populated cells
+    "nbytes": ("int64", None),
+    "nodes": ("int32", 3),  # level, ix, iy
+}
+
+Tile = collections.namedtuple("Tile", ["index", "key", "path", "bounds", "width", "height", "block", "overviews", "stats", "nbytes"])
+
+
+def cell_range(bounds, level):
+    """
+    Range of quadtree cells at a level that a bounding box touches, as (ix0, iy0, ix1, iy1) inclusive
+    """
+    n = 2 ** level
+    cell_w = (WORLD[2] - WORLD[0]) / n
+    cell_h = (WORLD[3] - WORLD[1]) / n
+    minx, miny, maxx, maxy = bounds
+
+    ix0 = min(n - 1, max(0, int(math.floor((minx - WORLD[0]) / cell_w))))
+    iy0 = min(n - 1, max(0, int(math.floor((miny - WORLD[1]) / cell_h))))
+    ix1 = min(n - 1, max(0, int(math.floor((maxx - WORLD[0]) / cell_w))))
+    iy1 = min(n - 1, max(0, int(math.floor((maxy - WORLD[1]) / cell_h))))
+    return ix0, iy0, ix1, iy1
+
+
+def quadtree_node(bounds):
+    """
+    Deepest quadtree cell that fully contains the bounds, as (level, ix, iy)
+    """
+    minx, miny, maxx, maxy = bounds
+    inner = (minx + EDGE_EPS, miny + EDGE_EPS, maxx - EDGE_EPS, maxy - EDGE_EPS)
+
+    node = (0, 0, 0)
+    for level in range(1, MAX_LEVEL + 1):
+        ix0, iy0, ix1, iy1 = cell_range(inner, level)
+        if ix0 != ix1 or iy0 != iy1:
+            break
+        node = (level, ix0, iy0)
+    return node
+
+
+def quadkey(level, ix, iy):
+    """
+    Bing-style quadkey string for a cell, handy for naming and debugging. Row 0 is the southern edge.
+    """
+    digits = []
+    for i in range(level, 0, -1):
+        mask = 1 << (i - 1)
+        digits.append(str((1 if ix & mask else 0) + (2 if iy & mask else 0)))
+    return "".join(digits)
+
+
+def cell_scale(res):
+    """
+    Area of a cell at res = (x, y) degrees relative to a native 3ss cell. Cells hold people per native cell,
+    so a resampled cell's value is multiplied by this to get the people it covers.
+    """
+    return (abs(res[0]) * abs(res[1])) / (NATIVE_RES ** 2)
+
+
+def array_stats(arr, scale=1.0):
+    """
+    Min, max, population and populated cell count of a population array, or None if every cell is nodata (negative or NaN).
+    Min and max are raw cell values, the population is their sum times scale (see cell_scale).
+    """
+    valid = arr[np.isfinite(arr) & (arr >= 0)]
+    if valid.size == 0:
+        return None
+    return float(valid.min()), float(valid.max()), float(valid.sum(dtype="float64")) * scale, int(np.count_nonzero(valid))
+
+
+def tile_stats(ds):
+    """
+    array_stats of band 1 of an open dataset, read block by block. All zeros if it has no valid cells.
+    """
+    scale = cell_scale(ds.res)
+    t_min, t_max, t_sum, t_count = math.inf, -math.inf, 0.0, 0
+    for _, window in ds.block_windows(1):
+        arr = ds.read(1, window=window)
+        if ds.nodata is not None:
+            arr = np.where(arr == ds.nodata, -1, arr)
+        block = array_stats(arr, scale)
+        if block is None:
+            continue
+        b_min, b_max, b_sum, b_count = block
+        t_min, t_max = min(t_min, b_min), max(t_max, b_max)
+        t_sum += b_sum
+        t_count += b_count
+
+    if t_min == math.inf: #No valid cells
+        t_min = t_max = 0.0
+    return t_min, t_max, t_sum, t_count
+
+
+def column(name):
+    """
+    Property for one of the COLUMNS arrays of a TileCatalog, appending rows added since the last read first
+    """
+    def get(self):
+        self.flush()
+        return self.columns[name]
+
+    def set(self, value):
+        self.flush()
+        self.columns[name] = value
+
+    return property(get, set)
+
+
+class TileCatalog:
+    """
+    Quadtree-indexed catalog of COG tiles. Tile keys are paths relative to root, which may be a local directory or a /vsis3/ prefix.
+
+    Added tiles are indexed straight away but only appended to the arrays when they are next read, so adding N tiles
+    costs one concatenate per column rather than N.
+    """
+    bounds, sizes, blocks = column("bounds"), column("sizes"), column("blocks")
+    overviews, stats, nbytes, nodes = column("overviews"), column("stats"), column("nbytes"), column("nodes")
+
+    def __init__(self, root="."):
+        self.root = root
+        self.keys = []
+        self.columns = {name: np.empty((0, width) if width else 0, dtype=dtype) for name, (dtype, width) in COLUMNS.items()}
+        self.pending = []  # rows added since the arrays were last read, as {column: value}
+        self.build_index()
+
+    def __len__(self):
+        return len(self.keys)
+
+    # -------------------------
+    # Building
+    # -------------------------
+    def build_index(self):
+        """
+        Rebuild the key lookup and the per-level quadtree buckets from the flat arrays
+        """
+        self.key_index = {k: i for i, k in enumerate(self.keys)}
+        self.levels = collections.defaultdict(lambda: collections.defaultdict(list))
+        for i, (level, ix, iy) in enumerate(self.nodes.tolist()):
+            self.levels[level][(ix, iy)].append(i)
+
+    def flush(self):
+        """
+        Append the pending rows to the arrays
+        """
+        if not self.pending:
+            return
+        rows, self.pending = self.pending, []
+        for name, (dtype, _) in COLUMNS.items():
+            self.columns[name] = np.concatenate([self.columns[name], np.array([row[name] for row in rows], dtype=dtype)])
+
+    def add(self, path, stats=None):
+        """
+        Add or replace a tile, reading its metadata from the file. stats may be passed in if already known.
+        """
+        import rasterio
+
+        with rasterio.open(path) as ds:
+            bounds = tuple(ds.bounds)
+            block_h, block_w = ds.block_shapes[0]
+            factors = ds.overviews(1)[:MAX_OVERVIEWS]
+            row = {
+                "bounds": bounds,
+                "size": (ds.width, ds.height),
+                "block": (block_w, block_h),
+                "overviews": list(factors) + [0] * (MAX_OVERVIEWS - len(factors)),
+                "stats": stats if stats is not None else tile_stats(ds),
+            }
+        row["nbytes"] = os.path.getsize(path) if os.path.exists(path) else 0
+
+        key = os.path.relpath(path, self.root).replace("\\", "/")
+        self.add_entry(key, **row)
+
+    def add_entry(self, key, bounds, size, block, overviews, stats, nbytes):
+        """
+        Add or replace a tile from already known metadata. Only the tile's own quadtree bucket is updated.
+        """
+        node = tuple(quadtree_node(bounds))
+        row = {"bounds": bounds, "sizes": size, "blocks": block, "overviews": overviews, "stats": stats, "nbytes": nbytes, "nodes": node}
+
+        i = self.key_index.get(key)
+        if i is None:
+            i = self.key_index[key] = len(self.keys)
+            self.keys.append(key)
+            self.pending.append(row)
+        else:
+            stored = len(self.columns["nodes"])
+            if i < stored:
+                old_node = tuple(self.columns["nodes"][i].tolist())
+                for name, value in row.items():
+                    self.columns[name][i] = value
+            else:
+                old_node = self.pending[i - stored]["nodes"]
+                self.pending[i - stored] = row
+
+            level, ix, iy = old_node
+            bucket = self.levels[level][(ix, iy)]
+            bucket.remove(i)
+            if not bucket:
+                del self.levels[level][(ix, iy)]
+
+        level, ix, iy = node
+        self.levels[level][(ix, iy)].append(i)
+
+    def remove_within(self, bounds):
+        """
+        Drop every tile lying inside a bounding box, e.g. before a region is re-tiled. Returns the removed keys.
+        """
+        minx, miny, maxx, maxy = bounds
+        b = self.bounds
+        inside = (b[:, 0] >= minx) & (b[:, 1] >= miny) & (b[:, 2] <= maxx) & (b[:, 3] <= maxy)
+        removed = [k for k, r in zip(self.keys, inside) if r]
+
+        keep = ~inside
+        self.keys = [k for k, r in zip(self.keys, inside) if not r]
+        self.bounds, self.sizes, self.blocks = self.bounds[keep], self.sizes[keep], self.blocks[keep]
+        self.overviews, self.stats, self.nbytes, self.nodes = self.overviews[keep], self.stats[keep], self.nbytes[keep], self.nodes[keep]
+        self.build_index()
+        return removed
+
+    @classmethod
+    def build(cls, tile_dir, pattern="tile_*.tif"):
+        """
+        Catalog every tile in a directory tree
+        """
+        import glob
+
+        catalog = cls(tile_dir)
+        for path in sorted(glob.glob(os.path.join(tile_dir, "**", pattern), recursive=True)):
+            catalog.add(path)
+        return catalog
+
+    # -------------------------
+    # Queries
+    # -------------------------
+    def path(self, i):
+        return f"{self.root.rstrip('/')}/{self.keys[i]}"
+
+    def tile(self, i):
+        return Tile(
+            index=i,
+            key=self.keys[i],
+            path=self.path(i),
+            bounds=tuple(self.bounds[i].tolist()),
+            width=int(self.sizes[i, 0]),
+            height=int(self.sizes[i, 1]),
+            block=tuple(self.blocks[i].tolist()),
+            overviews=[f for f in self.overviews[i].tolist() if f],
+            stats=dict(zip(["min", "max", "population", "populated"], self.stats[i].tolist())),
+            nbytes=int(self.nbytes[i]),
+        )
+
+    def query(self, bounds):
+        """
+        Indices of tiles whose bounds overlap a (minx, miny, maxx, maxy) box
+        """
+        candidates = []
+        for level, cells in self.levels.items():
+            ix0, iy0, ix1, iy1 = cell_range(bounds, level)
+            if (ix1 - ix0 + 1) * (iy1 - iy0 + 1) > len(cells): #Cheaper to scan this level's occupied cells
+                for (ix, iy), idx in cells.items():
+                    if ix0 <= ix <= ix1 and iy0 <= iy <= iy1:
+                        candidates.extend(idx)
+            else:
+                for ix in range(ix0, ix1 + 1):
+                    for iy in range(iy0, iy1 + 1):
+                        candidates.extend(cells.get((ix, iy), ()))
+
+        if not candidates:
+            return []
+
+        idx = np.unique(candidates)
+        b = self.bounds[idx]
+        minx, miny, maxx, maxy = bounds
+        overlap = (b[:, 0] < maxx) & (b[:, 2] > minx) & (b[:, 1] < maxy) & (b[:, 3] > miny)
+        return idx[overlap].tolist()
+
+    def tiles_at(self, lon, lat):
+        """
+        Tiles containing a point, finest first
+        """
+        idx = [i for i in self.query((lon - EDGE_EPS, lat - EDGE_EPS, lon + EDGE_EPS, lat + EDGE_EPS))
+               if self.bounds[i, 0] <= lon <= self.bounds[i, 2] and self.bounds[i, 1] <= lat <= self.bounds[i, 3]]
+        return [self.tile(i) for i in sorted(idx, key=lambda i: -self.nodes[i, 0])]
+
+    def tiles_for(self, geometry):
+        """
+        Tiles intersecting a shapely geometry
+        """
+        from shapely.geometry import box
+
+        return [self.tile(i) for i in self.query(geometry.bounds) if box(*self.bounds[i]).intersects(geometry)]
+
+    def overview_for(self, tile, target_res):
+        """
+        Largest overview factor whose pixels are no coarser than target_res degrees, or 1 for full resolution
+        """
+        res = (tile.bounds[2] - tile.bounds[0]) / tile.width
+        best = 1
+        for factor in tile.overviews:
+            if res * factor <= target_res:
+                best = max(best, factor)
+        return best
+
+    def blocks_for(self, tile, bounds, factor=1):
+        """
+        Internal (block_row, block_col) indices of a tile, at an overview factor, that a bounding box touches
+        """
+        minx, miny, maxx, maxy = tile.bounds
+        width = -(-tile.width // factor)
+        height = -(-tile.height // factor)
+        res_x = (maxx - minx) / width
+        res_y = (maxy - miny) / height
+
+        col0 = max(0, int((bounds[0] - minx) // res_x))
+        col1 = min(width - 1, int((bounds[2] - minx) // res_x))
+        row0 = max(0, int((maxy - bounds[3]) // res_y))
+        row1 = min(height - 1, int((maxy - bounds[1]) // res_y))
+        if col0 > col1 or row0 > row1:
+            return []
+
+        block_w, block_h = tile.block
+        return [(r, c)
+                for r in range(row0 // block_h, row1 // block_h + 1)
+                for c in range(col0 // block_w, col1 // block_w + 1)]
+
+    # -------------------------
+    # Serialisation
+    # -------------------------
+    def save(self, path):
+        np.savez_compressed(
+            path,
+            version=np.array(CATALOG_VERSION),
+            keys=np.array(self.keys, dtype=str),
+            bounds=self.bounds,
+            sizes=self.sizes,
+            blocks=self.blocks,
+            overviews=self.overviews,
+            stats=self.stats,
+            nbytes=self.nbytes,
+            nodes=self.nodes,
+        )
+
+    @classmethod
+    def load(cls, path, root=None):
+        """
+        Load a saved catalog. Tile paths resolve against root, or the catalog's own directory by default.
+        """
+        with np.load(path, allow_pickle=False) as data:
+            if int(data["version"]) != CATALOG_VERSION:
+                raise ValueError(f"{path} is catalog version {int(data['version'])}, expected {CATALOG_VERSION}. Rebuild it with tile_catalog.py")
+
+            catalog = cls(root if root is not None else os.path.dirname(os.path.abspath(path)))
+            catalog.keys = data["keys"].tolist()
+            catalog.bounds = data["bounds"]
+            catalog.sizes = data["sizes"]
+            catalog.blocks = data["blocks"]
+            catalog.overviews = data["overviews"]
+            catalog.stats = data["stats"]
+            catalog.nbytes = data["nbytes"]
+            catalog.nodes = data["nodes"]
+        catalog.build_index()
+        return catalog
+
+    def save_json(self, path):
+        """
+        Write the tile keys, bounds, quadkeys, sizes and population sums for the frontend
+        """
+        tiles = [
+            {
+                "key": key,
+                "bounds": [round(v, 6) for v in self.bounds[i].tolist()],
+                "quadkey": quadkey(*self.nodes[i].tolist()),
+                "nbytes": int(self.nbytes[i]),
+                "population": round(float(self.stats[i, 2])),
+            }
+            for i, key in enumerate(self.keys)
+        ]
+        with open(path, "w") as f:
+            json.dump({"version": CATALOG_VERSION, "tiles": tiles}, f, separators=(",", ":"))
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Build a tile catalog for a directory of COG tiles")
+    parser.add_argument("tile_dir", nargs="?", default="cog_tiles")
+    args = parser.parse_args()
+
+    catalog = TileCatalog.build(args.tile_dir)
+    catalog.save(os.path.join(args.tile_dir, CATALOG_NAME))
+    catalog.save_json(os.path.join(args.tile_dir, CATALOG_JSON_NAME))
+    print(f"Catalogued {len(catalog)} tiles in {args.tile_dir}")
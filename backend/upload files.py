@@ -5,6 +5,9 @@ from botocore.exceptions import ClientError
 import threading
 from dotenv import load_dotenv
 
+import instrumentation as inst
+from tile_catalog import TileCatalog, CATALOG_NAME, CATALOG_JSON_NAME
+
 # ==== CONFIG ====
 R2_ACCESS_KEY = os.getenv("R2_ACCESS_KEY")
 R2_SECRET_KEY = os.getenv("R2_SECRET_KEY")
@@ -14,7 +17,7 @@ LOCAL_DIRECTORY = "cog_tiles"
 MAX_WORKERS = 32  # parallel uploads
 # ===============
 
-ENDPOINT = f"https://{ACCOUNT_ID}.r2.cloudflarestorage.com"
+ENDPOINT = os.getenv("R2_ENDPOINT", f"https://{ACCOUNT_ID}.r2.cloudflarestorage.com") # Override to point at a local S3 stand-in
 
 session = boto3.session.Session()
 s3 = session.client(
@@ -26,15 +29,32 @@ s3 = session.client(
 
 failed_uploads = []
 lock = threading.Lock()
+queued = 0  # submitted uploads not yet picked up by a worker
+active = 0  # uploads currently running
 
 def upload_single(file_path, key):
+    global queued, active
+    with lock:
+        queued -= 1
+        active += 1
+        inst.gauge("upload_queue_depth", queued)
+        inst.gauge("upload_active_workers", active)
+
     try:
-        s3.upload_file(file_path, BUCKET_NAME, key)
+        with inst.stage("upload_file"):
+            s3.upload_file(file_path, BUCKET_NAME, key)
+        inst.count("bytes_uploaded", os.path.getsize(file_path))
+        inst.count("files_uploaded")
         print(f"Uploaded: {key}")
     except Exception as e:
         print(f"FAILED: {key} -> {e}")
+        inst.count("upload_failures")
         with lock:
             failed_uploads.append(key)
+    finally:
+        with lock:
+            active -= 1
+            inst.gauge("upload_active_workers", active)
 
 def walk_all_files(root):
     for base, _, files in os.walk(root):
@@ -43,17 +63,45 @@ def walk_all_files(root):
             rel_path = os.path.relpath(full_path, root)
             yield full_path, rel_path.replace("\\", "/")
 
+def catalog_files(root):
+    """
+    Split the upload into the tiles listed in the catalog and the catalog files themselves.
+    Temp files and stray tiles in the directory are skipped.
+    """
+    catalog = TileCatalog.load(os.path.join(root, CATALOG_NAME), root=root)
+    tiles = [(catalog.path(i), key) for i, key in enumerate(catalog.keys)]
+    index_files = [(os.path.join(root, name), name) for name in (CATALOG_NAME, CATALOG_JSON_NAME)
+                   if os.path.exists(os.path.join(root, name))]
+    return tiles, index_files
+
 def main():
-    all_files = list(walk_all_files(LOCAL_DIRECTORY))
+    global queued
+    if os.path.exists(os.path.join(LOCAL_DIRECTORY, CATALOG_NAME)):
+        tile_files, index_files = catalog_files(LOCAL_DIRECTORY)
+    else:
+        print(f"No {CATALOG_NAME} in {LOCAL_DIRECTORY}, uploading every file")
+        tile_files, index_files = list(walk_all_files(LOCAL_DIRECTORY)), []
+    all_files = tile_files + index_files
     print(f"Uploading {len(all_files)} files...")
 
     with concurrent.futures.ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
         futures = []
-        for file_path, key in all_files:
+        for file_path, key in tile_files:
+            with lock:
+                queued += 1
+                inst.gauge("upload_queue_depth", queued)
             futures.append(executor.submit(upload_single, file_path, key))
 
         concurrent.futures.wait(futures)
 
+    # Upload the catalog last, so it never points at tiles that aren't there yet
+    if failed_uploads:
+        print("Skipping catalog upload, some tiles failed")
+    else:
+        for file_path, key in index_files:
+            queued += 1
+            upload_single(file_path, key)
+
     print("\n=== DONE ===")
     print(f"Total files: {len(all_files)}")
     print(f"Failed uploads: {len(failed_uploads)}")
@@ -64,4 +112,5 @@ def main():
         print("Saved failed upload list to failed_uploads.txt")
 
 if __name__ == "__main__":
-    main()
+    with inst.session("upload"):
+        main()
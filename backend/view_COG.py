@@ -3,7 +3,12 @@ from rasterio.plot import show
 import matplotlib.pyplot as plt
 import numpy as np
 
-cog_path = "./cog_tiles/tile_([-150,-140],[60,70]).tif"
+from io_profiles import apply_profile, profile_for
+from tile_catalog import TileCatalog, CATALOG_NAME
+
+catalog = TileCatalog.load(f"./cog_tiles/{CATALOG_NAME}")
+cog_path = catalog.tiles_at(-145, 65)[0].path
+apply_profile(profile_for(cog_path))
 
 with rasterio.open(cog_path) as src:
     print("CRS:", src.crs)